@@ -1,13 +1,23 @@
-import json
 import logging
+import operator
 import sys
 
 import os
 import asyncio
+import hashlib
+import random
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+import orjson
 from quart import Quart, request, jsonify, Response
-from llm_providers import get_llm_provider
+from quart.json.provider import DefaultJSONProvider
+from werkzeug.exceptions import RequestEntityTooLarge
+from llm_providers import LLMProvider, get_llm_provider
+from semantic_cache import SemanticCache
+import transcripts
 from transcripts import fetch_transcript, TranscriptNotFoundError
-from cachetools import TTLCache, cached
+from cachetools import TTLCache
 
 # Configure logging
 logger = logging.getLogger(__name__)
@@ -19,14 +29,80 @@ formatter = logging.Formatter(
 handler.setFormatter(formatter)
 logger.addHandler(handler)
 
-llm_provider = get_llm_provider()
-
 API_CACHE_MAX_SIZE = 128
 API_CACHE_TTL_SECONDS = 60 * 60  # an hour
+# Transcripts don't change once published, so they can be kept much longer
+TRANSCRIPT_CACHE_TTL_SECONDS = 60 * 60 * 24 * 7  # a week
+# Input budget for the transcript part of the prompt, estimated at ~4 characters
+# per token. That holds for English but undercounts CJK text by about 3-4x. Longer
+# transcripts are reduced to evenly spaced excerpts to bound prefill time.
+TRANSCRIPT_MAX_TOKENS = int(os.getenv("TRANSCRIPT_MAX_TOKENS", "12000"))
+TRANSCRIPT_CHARS_PER_TOKEN = 4
+TRANSCRIPT_EXCERPT_COUNT = 8
+TRANSCRIPT_OMISSION_MARKER = " [...] "
+LLM_CACHE_MAX_SIZE = 512
+LLM_CACHE_TTL_SECONDS = 60 * 60 * 24  # a day
+SEMANTIC_CACHE_SIMILARITY_THRESHOLD = 0.92
+# Largest accepted request body; oversized bodies are rejected with a 413 while
+# being received instead of being buffered and parsed in full.
+MAX_REQUEST_BODY_BYTES = 2 * 1024 * 1024
+# Limits on the prior chat turns that are copied into the /ask prompt
+CHAT_HISTORY_MAX_TURNS = 20
+CHAT_HISTORY_MAX_CONTENT_CHARS = 2000
+MAX_RETRY_DELAY_SECONDS = 60
+# Worker threads for blocking Gemini SDK calls (stream reads, embeddings). The asyncio
+# default is min(32, cpu_count + 4), which is only a handful on small pods.
+THREAD_POOL_MAX_WORKERS = 32
+
+# Matches watch?v=<id>, youtu.be/<id>, /shorts/<id> and /embed/<id> URLs
+VIDEO_ID_PATTERN = re.compile(
+    r"(?:v=|youtu\.be/|/shorts/|/embed/)([A-Za-z0-9_-]{11})"
+)
+
+# Small LLM chunks are buffered and sent as one SSE frame
+STREAM_COALESCE_MAX_CHARS = 256
+STREAM_COALESCE_MAX_DELAY_SECONDS = 0.05
+
+# Stop clients and reverse proxies (e.g. nginx ingress) from buffering the
+# stream, which would hold back the first chunks until a buffer fills.
+SSE_RESPONSE_HEADERS = {"Cache-Control": "no-cache", "X-Accel-Buffering": "no"}
+
+# Pre-encoded SSE frames; per-chunk frames are built from bytes in the generators
+SUMMARY_STREAM_END_EVENT = (
+    b'event: stream_end\ndata: {"message": "Summary stream finished"}\n\n'
+)
+ANSWER_STREAM_END_EVENT = (
+    b'event: stream_end\ndata: {"message": "Answer stream finished"}\n\n'
+)
+STREAM_ERROR_EVENT = (
+    b"event: error\ndata: "
+    + orjson.dumps(
+        {
+            "error": "An unexpected error occurred during streaming.",
+            "status_code": 500,
+        }
+    )
+    + b"\n\n"
+)
 
 # Create a TTLCache instance
-# This is the cache object that the @cached decorator will use.
-api_response_cache = TTLCache(maxsize=API_CACHE_MAX_SIZE, ttl=API_CACHE_TTL_SECONDS)
+# Holds the joined transcript text, which is the form the handlers consume.
+# Only touched from the event loop, so it needs no lock.
+transcript_text_cache = TTLCache(
+    maxsize=API_CACHE_MAX_SIZE, ttl=TRANSCRIPT_CACHE_TTL_SECONDS
+)
+# Fetches currently running per video_id, shared by concurrent requests
+in_flight_transcript_fetches = {}
+# Complete LLM responses keyed by a hash of model, system prompt and user prompt
+llm_response_cache = TTLCache(maxsize=LLM_CACHE_MAX_SIZE, ttl=LLM_CACHE_TTL_SECONDS)
+# LLM responses currently streaming, keyed like llm_response_cache
+in_flight_llm_responses = {}
+# Answers to opening /ask questions, matched by question embedding similarity
+semantic_answer_cache = SemanticCache(
+    similarity_threshold=SEMANTIC_CACHE_SIMILARITY_THRESHOLD,
+    maxsize=API_CACHE_MAX_SIZE,
+    ttl=API_CACHE_TTL_SECONDS,
+)
 
 
 def read_prompt(filename):
@@ -52,12 +128,301 @@ if not os.path.isdir(prompts_dir):
 
 
 prompts = {name: read_prompt(name) for name in ["ask", "summarize"]}
+
+# Static parts of the user prompts, hoisted so that each request only joins
+# the (potentially multi-MB) transcript once instead of re-formatting it.
+SUMMARIZE_PROMPT_PREFIX = "The transcript:\n\n```"
+SUMMARIZE_PROMPT_SUFFIX = "\n```"
+ASK_PROMPT_TRANSCRIPT_OPEN = "\n<TRANSCRIPT>\n"
+ASK_PROMPT_SUMMARY_OPEN = "\n</TRANSCRIPT>\n<SUMMARY>\n"
+ASK_PROMPT_HISTORY_OPEN = "\n</SUMMARY>\n<CHAT_HISTORY>\n```json\n"
+ASK_PROMPT_QUESTION_OPEN = "\n```\n</CHAT_HISTORY>\n<CURRENT_QUESTION>\n"
+ASK_PROMPT_QUESTION_CLOSE = "\n</CURRENT_QUESTION>\n"
+
+
+def build_summarize_user_prompt(transcript_text: str) -> str:
+    return "".join((SUMMARIZE_PROMPT_PREFIX, transcript_text, SUMMARIZE_PROMPT_SUFFIX))
+
+
+def build_ask_user_prompt(
+    transcript_text: str, summary: str, history_json: str, question: str
+) -> str:
+    return "".join(
+        (
+            ASK_PROMPT_TRANSCRIPT_OPEN,
+            transcript_text,
+            ASK_PROMPT_SUMMARY_OPEN,
+            summary,
+            ASK_PROMPT_HISTORY_OPEN,
+            history_json,
+            ASK_PROMPT_QUESTION_OPEN,
+            question,
+            ASK_PROMPT_QUESTION_CLOSE,
+        )
+    )
+
+
+class OrjsonProvider(DefaultJSONProvider):
+    """JSON provider backing request.get_json() and jsonify() with orjson."""
+
+    def dumps(self, obj, **kwargs) -> str:
+        return orjson.dumps(obj, default=self.default).decode()
+
+    def loads(self, s, **kwargs):
+        return orjson.loads(s)
+
+
 app = Quart(__name__)
+app.json = OrjsonProvider(app)
+app.config["MAX_CONTENT_LENGTH"] = MAX_REQUEST_BODY_BYTES
+
+
+# Threads are only started on demand, so creating the pool at import is cheap
+thread_pool = ThreadPoolExecutor(max_workers=THREAD_POOL_MAX_WORKERS)
+
+
+@app.before_serving
+async def configure_thread_pool():
+    asyncio.get_running_loop().set_default_executor(thread_pool)
+
+
+@app.after_serving
+async def close_clients():
+    await transcripts.aclose()
+    # The provider is created on first use, so there may be nothing to close
+    if get_llm_provider.cache_info().currsize:
+        await get_llm_provider().aclose()
+    # Don't let a Gemini stream blocked in next() hold shutdown up
+    thread_pool.shutdown(wait=False, cancel_futures=True)
+
+
+def extract_video_id(video_url: str) -> str | None:
+    video_id_match = VIDEO_ID_PATTERN.search(video_url)
+    return video_id_match.group(1) if video_id_match else None
+
+
+def limit_transcript_text(transcript_text: str) -> str:
+    """
+    Fits a transcript into the token budget. An oversized transcript is reduced to
+    evenly spaced excerpts, so the LLM still sees the whole video and not just its
+    opening.
+    """
+    max_chars = TRANSCRIPT_MAX_TOKENS * TRANSCRIPT_CHARS_PER_TOKEN
+    text_length = len(transcript_text)
+    if text_length <= max_chars:
+        return transcript_text
+
+    excerpt_chars = max(
+        1,
+        (max_chars - (TRANSCRIPT_EXCERPT_COUNT - 1) * len(TRANSCRIPT_OMISSION_MARKER))
+        // TRANSCRIPT_EXCERPT_COUNT,
+    )
+    stride = (text_length - excerpt_chars) / (TRANSCRIPT_EXCERPT_COUNT - 1)
+    excerpts = []
+    for excerpt_index in range(TRANSCRIPT_EXCERPT_COUNT):
+        start = round(excerpt_index * stride)
+        end = start + excerpt_chars
+        # Trim each excerpt to word boundaries
+        if start > 0:
+            space = transcript_text.find(" ", start, end)
+            if space != -1:
+                start = space + 1
+        if end < text_length:
+            space = transcript_text.rfind(" ", start, end)
+            if space > start:
+                end = space
+        excerpts.append(transcript_text[start:end])
+    return TRANSCRIPT_OMISSION_MARKER.join(excerpts)
+
+
+async def fetch_transcript_text(video_id: str) -> str:
+    transcript = await fetch_transcript(video_id)
+    transcript_text = " ".join(map(operator.itemgetter("text"), transcript))
+    return limit_transcript_text(transcript_text)
+
+
+async def fetch_cached_transcript_text(video_id: str) -> str:
+    """
+    Returns the joined transcript for a video, fetching it at most once at a time.
+
+    Cache hits return immediately. On a miss, concurrent callers for the same
+    video_id share a single fetch task instead of each hitting YouTube.
+    """
+    if video_id in transcript_text_cache:
+        return transcript_text_cache[video_id]
+
+    fetch = in_flight_transcript_fetches.get(video_id)
+    if fetch is None:
+        fetch = asyncio.ensure_future(fetch_transcript_text(video_id))
+        in_flight_transcript_fetches[video_id] = fetch
+
+        def on_fetch_done(task):
+            in_flight_transcript_fetches.pop(video_id, None)
+            if not task.cancelled() and task.exception() is None:
+                transcript_text_cache[video_id] = task.result()
+
+        fetch.add_done_callback(on_fetch_done)
+
+    # Shield so that one client disconnecting doesn't cancel the shared fetch
+    return await asyncio.shield(fetch)
+
+
+async def coalesce_chunks(
+    chunks,
+    max_chars=STREAM_COALESCE_MAX_CHARS,
+    max_delay_seconds=STREAM_COALESCE_MAX_DELAY_SECONDS,
+):
+    """
+    Merges consecutive chunks from an async iterator to cut per-frame overhead.
+
+    A merged chunk is yielded once it reaches `max_chars` or once `max_delay_seconds`
+    have passed since the last yield, even if no further chunk has arrived. Any
+    remainder is yielded when `chunks` ends or raises.
+    """
+    chunk_iterator = aiter(chunks)
+    next_chunk = None
+    buffer = []
+    buffered_chars = 0
+    flush_deadline = time.monotonic() + max_delay_seconds
+    try:
+        while True:
+            if next_chunk is None:
+                # Kept across timeouts; cancelling a pending anext would end `chunks`
+                next_chunk = asyncio.ensure_future(anext(chunk_iterator))
+            timeout = None
+            if buffer:
+                timeout = max(0.0, flush_deadline - time.monotonic())
+            done, _ = await asyncio.wait((next_chunk,), timeout=timeout)
+            if done:
+                try:
+                    chunk = next_chunk.result()
+                except StopAsyncIteration:
+                    break
+                finally:
+                    next_chunk = None
+                buffer.append(chunk)
+                buffered_chars += len(chunk)
+            now = time.monotonic()
+            if buffer and (buffered_chars >= max_chars or now >= flush_deadline):
+                yield "".join(buffer)
+                buffer.clear()
+                buffered_chars = 0
+                flush_deadline = now + max_delay_seconds
+    except Exception:
+        # Deliver what was already received before the upstream error propagates
+        if buffer:
+            yield "".join(buffer)
+            buffer.clear()
+        raise
+    finally:
+        if next_chunk is not None:
+            next_chunk.cancel()
+    if buffer:
+        yield "".join(buffer)
+
+
+class InFlightResponse:
+    """An LLM response being streamed, which concurrent identical requests share."""
+
+    def __init__(self):
+        self.chunks = []
+        self.done = False
+        self.error = None
+        self.task = None
+        self.subscribers = 0
+        self._changed = asyncio.Condition()
+
+    async def _notify(self):
+        async with self._changed:
+            self._changed.notify_all()
+
+    async def publish(self, chunks):
+        """Consumes `chunks`, recording each one for current and later subscribers."""
+        try:
+            async for chunk in chunks:
+                self.chunks.append(chunk)
+                await self._notify()
+        except asyncio.CancelledError:
+            self.error = RuntimeError("LLM stream was cancelled")
+            raise
+        except Exception as e:
+            self.error = e
+        finally:
+            self.done = True
+            await self._notify()
+
+    async def subscribe(self):
+        """
+        Yields every chunk from the start, then raises any stream error.
+
+        The publishing task is cancelled if every subscriber leaves before the
+        stream is done, so nobody pays for a generation that no one receives.
+        """
+        index = 0
+        self.subscribers += 1
+        try:
+            while True:
+                while index < len(self.chunks):
+                    yield self.chunks[index]
+                    index += 1
+                if self.done:
+                    break
+                async with self._changed:
+                    await self._changed.wait_for(
+                        lambda: self.done or index < len(self.chunks)
+                    )
+        finally:
+            self.subscribers -= 1
+            if not self.subscribers and not self.done and self.task is not None:
+                self.task.cancel()
+        if self.error is not None:
+            # A fresh exception per subscriber, so tracebacks don't pile up on one
+            raise RuntimeError(f"LLM stream failed: {self.error}") from self.error
+
+
+async def generate_cached_content_stream(
+    llm_provider: LLMProvider, system_prompt: str, user_prompt: str
+):
+    """
+    Streams an LLM response, replaying it from `llm_response_cache` on an exact match.
 
+    Concurrent identical requests share one provider stream. A response is only
+    cached once it has been streamed to completion, so failed streams are never
+    replayed. The shared stream keeps running while any client is still reading
+    it and is cancelled once all of them have disconnected.
+    """
+    cache_key = hashlib.sha256(
+        "\0".join((llm_provider.model_name, system_prompt, user_prompt)).encode()
+    ).hexdigest()
+    cached_response = llm_response_cache.get(cache_key)
+    if cached_response is not None:
+        logger.info(f"Serving LLM response from cache ({cache_key[:12]})")
+        yield cached_response
+        return
+
+    in_flight = in_flight_llm_responses.get(cache_key)
+    if in_flight is None:
+        in_flight = InFlightResponse()
+        in_flight_llm_responses[cache_key] = in_flight
+        in_flight.task = asyncio.ensure_future(
+            in_flight.publish(
+                coalesce_chunks(
+                    llm_provider.generate_content_stream(system_prompt, user_prompt)
+                )
+            )
+        )
 
-@cached(cache=api_response_cache)
-def fetch_cached_transcript(video_id: str):
-    return fetch_transcript(video_id)
+        def on_stream_done(task):
+            in_flight_llm_responses.pop(cache_key, None)
+            if in_flight.error is None:
+                llm_response_cache[cache_key] = "".join(in_flight.chunks)
+
+        in_flight.task.add_done_callback(on_stream_done)
+    else:
+        logger.info(f"Joining in-flight LLM response ({cache_key[:12]})")
+
+    async for chunk in in_flight.subscribe():
+        yield chunk
 
 
 async def fetch_transcript_with_retries(
@@ -73,7 +438,7 @@ async def fetch_transcript_with_retries(
         initial_delay_seconds (int): Initial delay in seconds for backoff before the first retry.
 
     Returns:
-        tuple: (transcript_list, None) on success.
+        tuple: (transcript_text, None) on success, with segments joined by spaces.
                (None, error_event_string) on failure, where error_event_string is SSE formatted.
     """
     num_attempts_to_make = max(1, total_attempts)  # Ensure at least one attempt
@@ -88,17 +453,17 @@ async def fetch_transcript_with_retries(
             else:
                 logger.info(f"Fetching transcript for {video_id}")
 
-            transcript_list = fetch_cached_transcript(video_id)
+            transcript_text = await fetch_cached_transcript_text(video_id)
             logger.info(
                 f"Successfully fetched transcript for {video_id} on attempt {current_attempt_one_based}"
             )
-            return transcript_list, None  # Success
+            return transcript_text, None  # Success
 
         except TranscriptNotFoundError as e:
             logger.error(
                 f"Transcript does not exist for {video_id}, failing immediately"
             )
-            error_event = f"event: error\ndata: {json.dumps({'error': str(e), 'status_code': 404})}\n\n"
+            error_event = f"event: error\ndata: {orjson.dumps({'error': str(e), 'status_code': 404}).decode()}\n\n"
             return None, error_event
 
         except Exception as e:
@@ -111,21 +476,25 @@ async def fetch_transcript_with_retries(
                 logger.error(
                     f"Error fetching transcript for {video_id} after {num_attempts_to_make} attempts: {str(e)}"
                 )
-                error_event = f"event: error\ndata: {json.dumps({'error': f'Error fetching transcript after {num_attempts_to_make} attempts: {str(e)}', 'status_code': 500})}\n\n"
+                error_event = f"event: error\ndata: {orjson.dumps({'error': f'Error fetching transcript after {num_attempts_to_make} attempts: {str(e)}', 'status_code': 500}).decode()}\n\n"
                 return None, error_event  # Retries exhausted
 
             # Calculate delay for the next retry (exponential backoff)
             # Delay = initial_delay * (2 ^ number_of_previous_failures)
             # Here, attempt_num_zero_based is 0 for the first try, 1 for the second, etc.
             # So, 2 ** attempt_num_zero_based is correct for the delay *before* the next attempt.
-            delay = initial_delay_seconds
-            logger.info(f"Retrying in {delay} seconds...")
+            # Jitter spreads out retries from concurrent requests for the same video.
+            delay = min(
+                MAX_RETRY_DELAY_SECONDS,
+                initial_delay_seconds * (2**attempt_num_zero_based),
+            ) * random.uniform(0.5, 1.5)
+            logger.info(f"Retrying in {delay:.2f} seconds...")
             await asyncio.sleep(delay)
 
     # Fallback: This should ideally not be reached if num_attempts_to_make >= 1,
     # as all outcomes (success, definitive error, retries exhausted) should return from the loop.
     logger.error(f"Transcript fetching for {video_id} unexpectedly exited retry loop.")
-    final_error_event = f"event: error\ndata: {json.dumps({'error': 'Unknown error fetching transcript after all retries', 'status_code': 500})}\n\n"
+    final_error_event = f"event: error\ndata: {orjson.dumps({'error': 'Unknown error fetching transcript after all retries', 'status_code': 500}).decode()}\n\n"
     return None, final_error_event
 
 
@@ -145,60 +514,57 @@ async def summarize():
         if not video_url:
             return jsonify({"error": "URL parameter is required"}), 400
 
-        try:
-            video_id = video_url.split("v=")[1].split("&")[0]
-        except IndexError:
+        video_id = extract_video_id(video_url)
+        if not video_id:
             return jsonify({"error": "Invalid YouTube URL format"}), 400
 
+        try:
+            llm_provider = get_llm_provider()
+        except ValueError as e:
+            logger.error(f"LLM provider unavailable: {str(e)}")
+            return jsonify({"error": "LLM provider is not configured"}), 503
+
         async def stream_generator():
-            headers = {  # Standard SSE headers
-                "Content-Type": "text/event-stream",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
-            }
             try:
                 # Send video_id as an initial metadata event
-                yield f"event: metadata\ndata: {json.dumps({'video_id': video_id})}\n\n"
-
-                # Fetch transcript using the new helper function
-                transcript_list, error_event = await fetch_transcript_with_retries(
-                    video_id,
-                    logger,  # Pass the new logger instance
-                    total_attempts=3,
-                    initial_delay_seconds=1,
+                yield (
+                    b"event: metadata\ndata: "
+                    + orjson.dumps({"video_id": video_id})
+                    + b"\n\n"
                 )
 
+                transcript_text, error_event = await transcript_fetch
+
                 if (
                     error_event
                 ):  # If fetch_transcript_with_retries returned an error event string
                     yield error_event
                     return  # Stop generation
 
-                transcript_text = " ".join([entry["text"] for entry in transcript_list])
-
                 # Stream the summary from LLM
-                async for chunk in llm_provider.generate_content_stream(
+                async for chunk in generate_cached_content_stream(
+                    llm_provider,
                     prompts["summarize"],
-                    f"The transcript:\n\n```{transcript_text}\n```",
+                    build_summarize_user_prompt(transcript_text),
                 ):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                    yield b'data: {"chunk": ' + orjson.dumps(chunk) + b"}\n\n"
 
-                yield f"event: stream_end\ndata: {json.dumps({'message': 'Summary stream finished'})}\n\n"
+                yield SUMMARY_STREAM_END_EVENT
 
             except Exception as e:
                 logger.error(f"Error during /summarize stream generation: {str(e)}")
                 # Ensure a final error event is sent if an unexpected error occurs mid-stream
-                error_payload = json.dumps(
-                    {
-                        "error": "An unexpected error occurred during streaming.",
-                        "status_code": 500,
-                    }
-                )
-                yield f"event: error\ndata: {error_payload}\n\n"
+                yield STREAM_ERROR_EVENT
 
         # Return a streaming response
-        return Response(stream_generator(), mimetype="text/event-stream")
-
+        return Response(
+            stream_generator(),
+            mimetype="text/event-stream",
+            headers=SSE_RESPONSE_HEADERS,
+        )
+
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Request body is too large"}), 413
     except Exception as e:
         # Catches errors *before* streaming starts (e.g., bad JSON in request, initial validation)
         logger.error(f"Pre-stream error in /summarize: {str(e)}")
@@ -221,6 +587,7 @@ async def ask_question():
         if (
             not message_history
             or not isinstance(message_history, list)
+            or not all(isinstance(message, dict) for message in message_history)
             or not message_history[-1].get("content")
         ):
             return (
@@ -244,20 +611,71 @@ async def ask_question():
                 422,
             )
 
-        try:
-            video_id = video_url.split("v=")[1].split("&")[0]
-        except IndexError:
+        video_id = extract_video_id(video_url)
+        if not video_id:
             return jsonify({"error": "Invalid YouTube URL format"}), 400
 
-        async def stream_generator():
-            headers = {
-                "Content-Type": "text/event-stream",
-                "Cache-Control": "no-cache",
-                "Connection": "keep-alive",
+        try:
+            llm_provider = get_llm_provider()
+        except ValueError as e:
+            logger.error(f"LLM provider unavailable: {str(e)}")
+            return jsonify({"error": "LLM provider is not configured"}), 503
+
+        # Only role and content are useful to the model; anything else the client
+        # attaches to a message would just add prompt tokens.
+        prior_turns = [
+            {
+                "role": message.get("role"),
+                "content": str(message.get("content", ""))[
+                    :CHAT_HISTORY_MAX_CONTENT_CHARS
+                ],
             }
+            for message in message_history[-CHAT_HISTORY_MAX_TURNS - 1 : -1]
+        ]
+        # Serialize the history once, before streaming starts. orjson keeps
+        # non-ASCII text as-is rather than \u-escaping it into the prompt.
+        # The current question is sent separately after it, so the prompt up to
+        # the end of the history is an append-only prefix across turns, which
+        # lets providers reuse their prompt cache for follow-up questions.
+        history_json = orjson.dumps(prior_turns).decode()
+
+        # Follow-up questions depend on the conversation so far, so only the
+        # opening question of a chat is eligible for the semantic cache.
+        use_semantic_cache = (
+            len(message_history) == 1 and llm_provider.supports_embeddings
+        )
+
+        async def stream_generator():
+            # Start the transcript fetch right away so it overlaps the question
+            # embedding below instead of waiting for it on a semantic cache miss
+            transcript_fetch = asyncio.ensure_future(
+                fetch_transcript_with_retries(
+                    video_id,
+                    logger,  # Pass the new logger instance
+                    total_attempts=3,
+                    initial_delay_seconds=1,
+                )
+            )
             try:
+                question_embedding = None
+                if use_semantic_cache:
+                    try:
+                        question_embedding = await llm_provider.embed_content(question)
+                    except Exception as e:
+                        logger.warning(f"Skipping semantic cache for {video_id}: {e}")
+                if question_embedding is not None:
+                    cached_answer = semantic_answer_cache.lookup(
+                        video_id, question_embedding
+                    )
+                    if cached_answer is not None:
+                        logger.info(f"Serving cached answer for {video_id}")
+                        cached_chunk = orjson.dumps(cached_answer)
+                        yield b'data: {"chunk": ' + cached_chunk + b"}\n\n"
+                        yield ANSWER_STREAM_END_EVENT
+                        return
+
                 # Fetch transcript using the new helper function
-                transcript_list, error_event = await fetch_transcript_with_retries(
+                transcript_text, error_event = await fetch_transcript_with_retries(
                     video_id,
                     logger,  # Pass the new logger instance
                     total_attempts=3,
@@ -270,53 +688,48 @@ async def ask_question():
                     yield error_event
                     return  # Stop generation
 
-                transcript_text = " ".join([entry["text"] for entry in transcript_list])
-
-                user_prompt = f"""
-<TRANSCRIPT>
-{transcript_text}
-</TRANSCRIPT>
-<SUMMARY>
-{summary}
-</SUMMARY>
-<CHAT_HISTORY>
-```json
-{json.dumps(message_history)}
-```
-</CHAT_HISTORY>
-<CURRENT_QUESTION>
-{question}
-</CURRENT_QUESTION>
-"""
+                user_prompt = build_ask_user_prompt(
+                    transcript_text, summary, history_json, question
+                )
 
                 # Stream the answer from LLM
-                async for chunk in llm_provider.generate_content_stream(
-                    prompts["ask"], user_prompt
+                answer_parts = []
+                async for chunk in generate_cached_content_stream(
+                    llm_provider, prompts["ask"], user_prompt
                 ):
-                    yield f"data: {json.dumps({'chunk': chunk})}\n\n"
+                    answer_parts.append(chunk)
+                    yield b'data: {"chunk": ' + orjson.dumps(chunk) + b"}\n\n"
+
+                if question_embedding is not None:
+                    semantic_answer_cache.add(
+                        video_id, question_embedding, "".join(answer_parts)
+                    )
 
-                yield f"event: stream_end\ndata: {json.dumps({'message': 'Answer stream finished'})}\n\n"
+                yield ANSWER_STREAM_END_EVENT
 
             except Exception as e:
                 logger.error(f"Error during /ask stream generation: {str(e)}")
-                error_payload = json.dumps(
-                    {
-                        "error": "An unexpected error occurred during streaming.",
-                        "status_code": 500,
-                    }
-                )
-                yield f"event: error\ndata: {error_payload}\n\n"
-
-        return Response(stream_generator(), mimetype="text/event-stream")
-
+                yield STREAM_ERROR_EVENT
+            finally:
+                # Not needed after a semantic cache hit or a client disconnect. The
+                # shared fetch itself is shielded, so it still fills the cache.
+                transcript_fetch.cancel()
+
+        return Response(
+            stream_generator(),
+            mimetype="text/event-stream",
+            headers=SSE_RESPONSE_HEADERS,
+        )
+
+    except RequestEntityTooLarge:
+        return jsonify({"error": "Request body is too large"}), 413
     except Exception as e:
         # Catches errors *before* streaming starts
         logger.error(f"Pre-stream error in /ask: {str(e)}")
         return jsonify({"error": f"An error occurred: {str(e)}"}), 500
 
 
-if __name__ == "main":
-    # Ensure llm_provider is initialized before app.run
-    # This is already done at the global scope.
+if __name__ == "__main__":
+    # The LLM provider is initialized lazily on the first request.
     logger.info("Starting Quart app...")
     app.run(host="0.0.0.0", port=5000)
@@ -1,11 +1,12 @@
 from abc import ABC, abstractmethod
+import functools
 import os
 import asyncio
 from typing import AsyncIterator
 
 import google.generativeai as genai
 from google.generativeai.types import HarmCategory, HarmBlockThreshold # For safety settings
-from openai import OpenAI, AsyncOpenAI # Import AsyncOpenAI for streaming
+from openai import AsyncOpenAI
 
 # Helper to print errors clearly
 def print_error(message):
@@ -13,7 +14,7 @@ def print_error(message):
 
 class LLMProvider(ABC):
     @abstractmethod
-    def generate_content(self, prompt: str, content: str) -> str:
+    async def generate_content(self, prompt: str, content: str) -> str:
         """
         Generate content based on system prompt and input content (non-streaming).
         Args:
@@ -38,8 +39,41 @@ class LLMProvider(ABC):
         if False: # Will be overridden by concrete implementations
             yield ""
 
+    @property
+    def supports_embeddings(self) -> bool:
+        return bool(getattr(self, "embedding_model_name", None))
+
+    async def embed_content(self, content: str) -> list[float]:
+        """
+        Embed content for similarity comparisons.
+        Args:
+            content: Text to embed
+        Returns:
+            Embedding vector
+        """
+        raise NotImplementedError(f"{type(self).__name__} does not support embeddings")
+
+    async def aclose(self) -> None:
+        """Release any network clients held by the provider."""
+        pass
+
 
 class GeminiProvider(LLMProvider):
+    # Optional: Configure safety settings to be less restrictive if needed.
+    # This can help avoid empty responses if content is borderline.
+    # Use with caution and understand the implications.
+    # Shared by all instances; treat as read-only.
+    safety_settings = {
+        HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
+        HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
+    }
+    # To disable safety settings (use with extreme caution):
+    # safety_settings = None
+    # To use default safety settings:
+    # safety_settings = {} # Or don't pass safety_settings to generate_content
+
     def __init__(self) -> None:
         self.model_name = os.getenv("GEMINI_MODEL")
         if not self.model_name:
@@ -52,32 +86,21 @@ class GeminiProvider(LLMProvider):
             raise ValueError("GEMINI_API_KEY environment variable not set.")
         
         genai.configure(api_key=api_key)
+
+        # Optional, enables the semantic cache for /ask (e.g. "models/text-embedding-004")
+        self.embedding_model_name = os.getenv("GEMINI_EMBEDDING_MODEL")
         
         # System instruction can be set at model initialization for newer models/versions
-        # For now, we'll include it in the combined content string as per current usage.
+        # For now, we'll send it as the first part of the user content.
         self.model = genai.GenerativeModel(self.model_name)
 
-        # Optional: Configure safety settings to be less restrictive if needed.
-        # This can help avoid empty responses if content is borderline.
-        # Use with caution and understand the implications.
-        self.safety_settings = {
-            HarmCategory.HARM_CATEGORY_HARASSMENT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_HATE_SPEECH: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_SEXUALLY_EXPLICIT: HarmBlockThreshold.BLOCK_NONE,
-            HarmCategory.HARM_CATEGORY_DANGEROUS_CONTENT: HarmBlockThreshold.BLOCK_NONE,
-        }
-        # To disable safety settings (use with extreme caution):
-        # self.safety_settings = None 
-        # To use default safety settings:
-        # self.safety_settings = {} # Or don't pass safety_settings to generate_content
-
-    def generate_content(self, prompt: str, content: str) -> str:
+    async def generate_content(self, prompt: str, content: str) -> str:
         try:
             # For some models, system prompt can be passed via `system_instruction`
-            # Here we combine them as the Quart app currently does.
-            full_prompt = f"{prompt}\n\n{content}"
-            response = self.model.generate_content(
-                full_prompt,
+            # (not available in the pinned SDK). Send prompt and content as separate
+            # parts of one user turn rather than copying them into a new string.
+            response = await self.model.generate_content_async(
+                [prompt, content],
                 safety_settings=self.safety_settings if self.safety_settings else None 
             )
             return response.text
@@ -92,11 +115,10 @@ class GeminiProvider(LLMProvider):
     async def generate_content_stream(self, prompt: str, content: str) -> AsyncIterator[str]:
         # The Gemini SDK's stream is a synchronous iterator.
         # We run the blocking part (getting the next item) in a thread pool.
-        full_prompt = f"{prompt}\n\n{content}"
-        
         try:
+            # Prompt and content go as separate parts to avoid copying the transcript
             sync_iterator = self.model.generate_content(
-                full_prompt,
+                [prompt, content],
                 stream=True,
                 safety_settings=self.safety_settings if self.safety_settings else None
             )
@@ -150,12 +172,25 @@ class GeminiProvider(LLMProvider):
                  pass # Error already printed
             raise # Re-raise to be handled by the Quart endpoint
 
+    async def embed_content(self, content: str) -> list[float]:
+        if not self.embedding_model_name:
+            return await super().embed_content(content)
+        # The Gemini SDK call is blocking, so run it in the thread pool.
+        loop = asyncio.get_event_loop()
+        result = await loop.run_in_executor(
+            None,
+            lambda: genai.embed_content(model=self.embedding_model_name, content=content),
+        )
+        return result["embedding"]
+
 
 class OpenAIProvider(LLMProvider):
     def __init__(self):
         self.api_key = os.getenv("OPENAI_API_KEY")
         self.base_url = os.getenv("OPENAI_BASE_URL") 
         self.model_name = os.getenv("OPENAI_MODEL")
+        # Optional, enables the semantic cache for /ask (e.g. "text-embedding-3-small")
+        self.embedding_model_name = os.getenv("OPENAI_EMBEDDING_MODEL")
 
         if not self.api_key:
             print_error("OPENAI_API_KEY environment variable not set.")
@@ -164,16 +199,17 @@ class OpenAIProvider(LLMProvider):
             print_error("OPENAI_MODEL environment variable not set.")
             raise ValueError("OPENAI_MODEL environment variable not set.")
 
-        # Synchronous client for non-streaming methods
-        self.llm = OpenAI(api_key=self.api_key, base_url=self.base_url)
-        # Asynchronous client for streaming methods
+        # Asynchronous client for both streaming and non-streaming methods
         self.async_llm = AsyncOpenAI(api_key=self.api_key, base_url=self.base_url)
-        # Note: For production, self.async_llm should be properly closed on app shutdown.
-        # Quart's app.shutdown or app.after_serving can be used.
+        # The client keeps its connection pool for the life of the provider;
+        # aclose() is called from the app's after_serving hook.
+
+    async def aclose(self) -> None:
+        await self.async_llm.close()
 
-    def generate_content(self, prompt: str, content: str) -> str:
+    async def generate_content(self, prompt: str, content: str) -> str:
         try:
-            response = self.llm.chat.completions.create(
+            response = await self.async_llm.chat.completions.create(
                 model=self.model_name,
                 messages=[
                     {"role": "system", "content": prompt},
@@ -212,7 +248,16 @@ class OpenAIProvider(LLMProvider):
             print_error(f"Error during OpenAI stream: {e}")
             raise # Re-raise to be handled by the Quart endpoint
 
+    async def embed_content(self, content: str) -> list[float]:
+        if not self.embedding_model_name:
+            return await super().embed_content(content)
+        response = await self.async_llm.embeddings.create(
+            model=self.embedding_model_name, input=content
+        )
+        return response.data[0].embedding
+
 
+@functools.lru_cache(maxsize=1)
 def get_llm_provider() -> LLMProvider:
     provider_name = os.getenv("LLM_PROVIDER", "openai").lower() # Default to openai for wider compatibility
     print(f"Attempting to initialize LLM provider: {provider_name}")
@@ -0,0 +1,56 @@
+import math
+import operator
+
+from cachetools import TTLCache
+
+
+class SemanticCache:
+    """
+    Caches answers per video and returns them for questions with a similar embedding.
+
+    Embeddings are normalized on insert, so cosine similarity reduces to a dot
+    product against each stored question for the video.
+    """
+
+    def __init__(
+        self,
+        similarity_threshold: float = 0.92,
+        max_entries_per_video: int = 32,
+        maxsize: int = 128,
+        ttl: int = 60 * 60,
+    ):
+        self.similarity_threshold = similarity_threshold
+        self.max_entries_per_video = max_entries_per_video
+        # video_id -> list of (normalized question embedding, answer)
+        self._entries = TTLCache(maxsize=maxsize, ttl=ttl)
+
+    @staticmethod
+    def _normalize(embedding: list[float]) -> list[float]:
+        norm = math.sqrt(sum(map(operator.mul, embedding, embedding)))
+        if not norm:
+            return embedding
+        return [value / norm for value in embedding]
+
+    def lookup(self, video_id: str, embedding: list[float]) -> str | None:
+        """Returns the cached answer most similar to `embedding`, if above threshold."""
+        entries = self._entries.get(video_id)
+        if not entries:
+            return None
+
+        query = self._normalize(embedding)
+        best_score, best_answer = max(
+            (
+                (sum(map(operator.mul, query, cached_embedding)), answer)
+                for cached_embedding, answer in entries
+            ),
+            key=operator.itemgetter(0),
+        )
+        if best_score >= self.similarity_threshold:
+            return best_answer
+        return None
+
+    def add(self, video_id: str, embedding: list[float], answer: str) -> None:
+        entries = self._entries.get(video_id, [])
+        entries.append((self._normalize(embedding), answer))
+        # Keep the most recent entries; re-setting also refreshes the TTL
+        self._entries[video_id] = entries[-self.max_entries_per_video :]
@@ -1,9 +1,16 @@
-import requests
-import base64
+import asyncio
+import functools
+import operator
+import httpx
+import binascii
 import json
-from googleapiclient.discovery import build
+import logging
+import orjson
+from cachetools import TTLCache
 import os
 
+logger = logging.getLogger(__name__)
+
 
 class TranscriptNotFoundError(Exception):
     """Raised when a requested transcript cannot be found for a video."""
@@ -13,6 +20,14 @@ class TranscriptNotFoundError(Exception):
         super().__init__(f"Requested transcript does not exist for video: {video_id}")
 
 
+class TranscriptResponseError(Exception):
+    """Raised when an InnerTube transcript response has an unexpected layout."""
+
+    def __init__(self, video_id: str):
+        self.video_id = video_id
+        super().__init__(f"Unexpected transcript response layout for video: {video_id}")
+
+
 # --- Configuration ---
 # IMPORTANT: Replace '<YOUR-YOUTUBE-API-KEY>' with your actual YouTube Data API Key.
 # It's highly recommended to set this as an environment variable:
@@ -20,19 +35,37 @@ class TranscriptNotFoundError(Exception):
 # You can get one from Google Cloud Console: https://console.cloud.google.com/apis/credentials
 YOUTUBE_API_KEY = os.environ.get("YOUTUBE_API_KEY", "<YOUR-YOUTUBE-API-KEY>")
 
-# Initialize YouTube Data API client (global for reusability)
-youtube_client = None
-if YOUTUBE_API_KEY != "<YOUR-YOUTUBE-API-KEY>":
-    try:
-        youtube_client = build("youtube", "v3", developerKey=YOUTUBE_API_KEY)
-    except Exception as e:
-        print(
-            f"Warning: Could not initialize YouTube Data API client. "
-            f"Some functionality (like default language detection) might be affected. Error: {e}"
-        )
-else:
-    print(
-        "WARNING: YOUTUBE_API_KEY is not set. "
+# Shared async HTTP client so InnerTube requests reuse pooled keep-alive
+# connections instead of paying a new TCP/TLS handshake on every transcript fetch.
+# With HTTP/2, concurrent fetches are multiplexed over one connection to
+# www.youtube.com. Only connection errors (e.g. a pooled connection closed by the
+# server) are retried here; the app already retries failed fetches with backoff.
+# httpx advertises brotli in Accept-Encoding once the Brotli package is installed,
+# so the large InnerTube JSON responses arrive compressed with br rather than gzip.
+HTTP_MAX_CONNECTIONS = 32
+HTTP_CONNECT_RETRIES = 2
+HTTP_TIMEOUT = httpx.Timeout(10.0, connect=3.05)
+
+# HTTP/2 and the pool limits belong on the transport; httpx ignores the client's
+# own transport options when `transport` is given.
+http_client = httpx.AsyncClient(
+    timeout=HTTP_TIMEOUT,
+    transport=httpx.AsyncHTTPTransport(
+        http2=True,
+        retries=HTTP_CONNECT_RETRIES,
+        limits=httpx.Limits(max_connections=HTTP_MAX_CONNECTIONS),
+    ),
+)
+
+
+async def aclose() -> None:
+    """Closes the shared HTTP client; call once on application shutdown."""
+    await http_client.aclose()
+
+
+if YOUTUBE_API_KEY == "<YOUR-YOUTUBE-API-KEY>":
+    logger.warning(
+        "YOUTUBE_API_KEY is not set. "
         "The script will attempt to proceed, but 'getDefaultSubtitleLanguage' "
         "will fail. Please set your YouTube Data API Key."
     )
@@ -46,8 +79,14 @@ else:
 # }
 
 
+# Tags and most lengths here are below 128 and encode as a single byte
+_SINGLE_BYTE_VARINTS = tuple(bytes((value,)) for value in range(0x80))
+
+
 def _encode_varint(value: int) -> bytes:
     """Encodes a single unsigned integer as a Protobuf varint."""
+    if value < 0x80:
+        return _SINGLE_BYTE_VARINTS[value]
     parts = bytearray()
     while True:
         byte = value & 0x7F
@@ -60,18 +99,18 @@ def _encode_varint(value: int) -> bytes:
     return bytes(parts)
 
 
-def _encode_string_field(field_number: int, value: str) -> bytes:
+def _encode_string_field(buffer: bytearray, field_number: int, value: str) -> None:
     """
-    Encodes a single string field according to Protobuf specification.
+    Encodes a single string field according to Protobuf specification,
+    appending it to `buffer` without building intermediate byte strings.
     (Tag, Length, Value)
     Wire type for string is 2 (Length-delimited).
     """
-    # Tag is (field_number << 3) | wire_type (2 for length-delimited)
-    tag = (field_number << 3) | 2
-    tag_bytes = _encode_varint(tag)
     value_bytes = value.encode("utf-8")
-    length_bytes = _encode_varint(len(value_bytes))
-    return tag_bytes + length_bytes + value_bytes
+    # Tag is (field_number << 3) | wire_type (2 for length-delimited)
+    buffer += _encode_varint((field_number << 3) | 2)
+    buffer += _encode_varint(len(value_bytes))
+    buffer += value_bytes
 
 
 def _get_base64_protobuf(message: dict) -> str:
@@ -82,30 +121,62 @@ def _get_base64_protobuf(message: dict) -> str:
     """
     buffer = bytearray()
     if "param1" in message and message["param1"] is not None:
-        buffer.extend(_encode_string_field(1, message["param1"]))
+        _encode_string_field(buffer, 1, message["param1"])
     if "param2" in message and message["param2"] is not None:
-        buffer.extend(_encode_string_field(2, message["param2"]))
+        _encode_string_field(buffer, 2, message["param2"])
 
-    return base64.b64encode(buffer).decode("utf-8")
+    # base64.b64encode is a thin wrapper around this call
+    return binascii.b2a_base64(buffer, newline=False).decode("ascii")
 
 
 # --- YouTube Data API Functions ---
 
+YOUTUBE_DATA_API_URL = "https://www.googleapis.com/youtube/v3"
+
+# A video's caption languages rarely change, so lookups are cached for a day.
+# Failed lookups raise and are therefore never cached.
+SUBTITLE_LANGUAGE_CACHE_MAX_SIZE = 4096
+SUBTITLE_LANGUAGE_CACHE_TTL_SECONDS = 60 * 60 * 24  # a day
+
+subtitle_language_cache = TTLCache(
+    maxsize=SUBTITLE_LANGUAGE_CACHE_MAX_SIZE, ttl=SUBTITLE_LANGUAGE_CACHE_TTL_SECONDS
+)
+
+
+async def _youtube_data_api_list(resource: str, **params) -> dict:
+    """
+    Calls a YouTube Data API v3 `list` endpoint directly over the shared client,
+    e.g. `_youtube_data_api_list("videos", part="snippet", id=video_id)`.
+    The key is sent as a header so it never appears in URLs quoted by errors.
+    """
+    response = await http_client.get(
+        f"{YOUTUBE_DATA_API_URL}/{resource}",
+        params=params,
+        headers={"x-goog-api-key": YOUTUBE_API_KEY},
+    )
+    response.raise_for_status()
+    return orjson.loads(response.content)
 
-def _get_default_subtitle_language(video_id: str) -> dict:
+
+async def _get_default_subtitle_language(video_id: str) -> dict:
     """
     Returns the default subtitle language of a video on YouTube.
-    Requires a valid `youtube_client` (YouTube Data API key).
+    Requires a valid YouTube Data API key.
+    Results are cached per video in `subtitle_language_cache`.
     """
-    if youtube_client is None:
+    cached_language = subtitle_language_cache.get(video_id)
+    if cached_language is not None:
+        return cached_language
+
+    if YOUTUBE_API_KEY == "<YOUR-YOUTUBE-API-KEY>":
         raise Exception(
-            "YouTube Data API client is not initialized. "
+            "YouTube Data API key is not set. "
             "Cannot fetch default subtitle language without a valid API key."
         )
 
     # Get video default language
-    videos_response = (
-        youtube_client.videos().list(part="snippet", id=video_id).execute()
+    videos_response = await _youtube_data_api_list(
+        "videos", part="snippet", id=video_id
     )
 
     if not videos_response.get("items"):
@@ -121,51 +192,86 @@ def _get_default_subtitle_language(video_id: str) -> dict:
     )
 
     # Get available subtitles
-    subtitles_response = (
-        youtube_client.captions().list(part="snippet", videoId=video_id).execute()
+    subtitles_response = await _youtube_data_api_list(
+        "captions", part="snippet", videoId=video_id
     )
 
     if not subtitles_response.get("items"):
         raise Exception(f"No subtitles found for video: {video_id}")
 
-    # Find the preferred language or default to the first available subtitle track
-    found_subtitle = None
-    if preferred_language:
-        for sub in subtitles_response["items"]:
-            if sub["snippet"]["language"] == preferred_language:
-                found_subtitle = sub
-                break
-
-    if not found_subtitle:
-        found_subtitle = subtitles_response["items"][
-            0
-        ]  # Fallback to the first available track
+    # Find the preferred language or default to the first available subtitle track.
+    # Tracks are indexed in reverse so the first track per language wins.
+    subtitle_items = subtitles_response["items"]
+    subtitles_by_language = {
+        sub["snippet"]["language"]: sub for sub in reversed(subtitle_items)
+    }
+    found_subtitle = subtitles_by_language.get(preferred_language) or subtitle_items[0]
 
     track_kind = found_subtitle["snippet"]["trackKind"]
     language = found_subtitle["snippet"]["language"]
 
-    return {"trackKind": track_kind, "language": language}
+    language_info = {"trackKind": track_kind, "language": language}
+    subtitle_language_cache[video_id] = language_info
+    return language_info
 
 
 # --- InnerTube API Helper Functions ---
 
+INNERTUBE_TRANSCRIPT_URL = "https://www.youtube.com/youtubei/v1/get_transcript"
+INNERTUBE_REQUEST_HEADERS = {"Content-Type": "application/json"}
+
+# The 'clientVersion' is crucial and YouTube often updates it.
+# If the script stops working, you might need to update this version
+# by inspecting network requests on a live YouTube video page.
+INNERTUBE_CONTEXT = {
+    "client": {
+        "clientName": "WEB",
+        "clientVersion": "2.20240826.01.00",  # Used from original JS code
+    },
+}
+
+# The request body is constant apart from `params`, so serialize the rest once.
+INNERTUBE_BODY_PREFIX = (
+    b'{"context": ' + json.dumps(INNERTUBE_CONTEXT).encode("utf-8") + b', "params": "'
+)
+INNERTUBE_BODY_SUFFIX = b'"}'
+
+# Location of the transcript segments within a get_transcript response
+INNERTUBE_SEGMENTS_PATH = (
+    "actions",
+    0,
+    "updateEngagementPanelAction",
+    "content",
+    "transcriptRenderer",
+    "content",
+    "transcriptSearchPanelRenderer",
+    "body",
+    "transcriptSegmentListRenderer",
+    "initialSegments",
+)
+
 
 def _extract_text(item: dict) -> str:
     """
     Helper function to extract text from certain elements in the InnerTube API response.
     """
-    if "simpleText" in item:
-        return item["simpleText"]
-    elif "runs" in item and item["runs"]:
-        return "".join(run["text"] for run in item["runs"])
-    return ""
-
-
-def _get_subtitles_from_innertube(
-    video_id: str, track_kind: str, language: str
-) -> list[dict]:
+    simple_text = item.get("simpleText")
+    if simple_text is not None:
+        return simple_text
+    runs = item.get("runs")
+    if not runs:
+        return ""
+    if len(runs) == 1:
+        # Transcript snippets are almost always a single run
+        return runs[0]["text"]
+    return "".join(run["text"] for run in runs)
+
+
+@functools.lru_cache(maxsize=256)
+def _get_encoded_track_params(track_kind: str, language: str) -> str:
     """
-    Function to retrieve subtitles for a given YouTube video using InnerTube API.
+    Encodes the inner protobuf message for track info. It depends only on the
+    caption track, so it is shared by every video with the same configuration.
     """
     # Construct the inner protobuf message for track info
     inner_message = {
@@ -175,7 +281,16 @@ def _get_subtitles_from_innertube(
     if track_kind == "asr":
         inner_message["param1"] = track_kind
 
-    encoded_inner_message = _get_base64_protobuf(inner_message)
+    return _get_base64_protobuf(inner_message)
+
+
+async def _get_subtitles_from_innertube(
+    video_id: str, track_kind: str, language: str
+) -> list[dict]:
+    """
+    Function to retrieve subtitles for a given YouTube video using InnerTube API.
+    """
+    encoded_inner_message = _get_encoded_track_params(track_kind, language)
 
     # Construct the outer protobuf message for the request parameters
     outer_message = {
@@ -184,43 +299,38 @@ def _get_subtitles_from_innertube(
     }
     params = _get_base64_protobuf(outer_message)
 
-    url = "https://www.youtube.com/youtubei/v1/get_transcript"
-    headers = {"Content-Type": "application/json"}
-
-    # The 'clientVersion' is crucial and YouTube often updates it.
-    # If the script stops working, you might need to update this version
-    # by inspecting network requests on a live YouTube video page.
-    data = {
-        "context": {
-            "client": {
-                "clientName": "WEB",
-                "clientVersion": "2.20240826.01.00",  # Used from original JS code
-            },
-        },
-        "params": params,
-    }
-
-    response = requests.post(url, json=data, headers=headers)
+    # `params` is base64, so it can be spliced into the JSON body without escaping
+    body = INNERTUBE_BODY_PREFIX + params.encode("ascii") + INNERTUBE_BODY_SUFFIX
+    response = await http_client.post(
+        INNERTUBE_TRANSCRIPT_URL, content=body, headers=INNERTUBE_REQUEST_HEADERS
+    )
     response.raise_for_status()  # Raises an exception for HTTP errors (4xx or 5xx)
-    response_data = response.json()
+    # The response is a few hundred KB of JSON; orjson parses it much faster
+    response_data = orjson.loads(response.content)
 
     # Accessing deep nested dictionary keys based on the YouTube InnerTube API response structure.
     # This structure is subject to change by YouTube.
     try:
-        initial_segments = response_data["actions"][0]["updateEngagementPanelAction"][
-            "content"
-        ]["transcriptRenderer"]["content"]["transcriptSearchPanelRenderer"]["body"][
-            "transcriptSegmentListRenderer"
-        ][
-            "initialSegments"
-        ]
-    except (KeyError, IndexError) as e:
-        raise TranscriptNotFoundError(video_id)
+        initial_segments = functools.reduce(
+            operator.getitem, INNERTUBE_SEGMENTS_PATH, response_data
+        )
+    except (KeyError, IndexError, TypeError) as e:
+        # Not proof that the video lacks captions (e.g. a layout change or an error
+        # payload), so this is kept apart from TranscriptNotFoundError
+        logger.warning(
+            "Unexpected InnerTube response layout for video %s (missing %r)",
+            video_id,
+            e,
+        )
+        raise TranscriptResponseError(video_id) from e
 
     if not initial_segments:
         raise TranscriptNotFoundError(video_id)
 
     output = []
+    append = output.append
+    extract_text = _extract_text
+    malformed_segments = 0
     for segment in initial_segments:
         # A segment can be a header or a transcript line
         line = segment.get("transcriptSectionHeaderRenderer") or segment.get(
@@ -237,29 +347,47 @@ def _get_subtitles_from_innertube(
 
         if start_ms is None or end_ms is None or snippet is None:
             # Ensure all expected fields are present for a valid transcript line
-            print(f"Warning: Skipping malformed segment in video {video_id}: {segment}")
+            malformed_segments += 1
             continue
 
-        text = _extract_text(snippet)
-
-        output.append(
+        start_ms = int(start_ms)
+        append(
             {
-                "text": text,
-                "start": int(start_ms) / 1000,
-                "duration": (int(end_ms) - int(start_ms)) / 1000,
+                "text": extract_text(snippet),
+                "start": start_ms / 1000,
+                "duration": (int(end_ms) - start_ms) / 1000,
             }
         )
 
+    if malformed_segments:
+        # Reported once per video rather than printing every segment
+        logger.warning(
+            "Skipped %d malformed segments in video %s", malformed_segments, video_id
+        )
+
     return output
 
 
 # --- Public API Function ---
 
+# Videos with no transcript in the language reported by the Data API are remembered
+# for an hour so repeated requests for them fail without going back to YouTube.
+TRANSCRIPT_NOT_FOUND_CACHE_MAX_SIZE = 8192
+TRANSCRIPT_NOT_FOUND_CACHE_TTL_SECONDS = 60 * 60  # an hour
+
+transcript_not_found_cache = TTLCache(
+    maxsize=TRANSCRIPT_NOT_FOUND_CACHE_MAX_SIZE,
+    ttl=TRANSCRIPT_NOT_FOUND_CACHE_TTL_SECONDS,
+)
+
 
-def fetch_transcript(video_id: str) -> list[dict]:
+async def fetch_transcript(video_id: str) -> list[dict]:
     """
     Fetches the transcript for a given YouTube video ID.
 
+    Both the YouTube Data API and InnerTube requests are made on the shared
+    async client. Videos known to have no transcript fail without any request.
+
     Args:
         video_id (str): The ID of the YouTube video.
 
@@ -269,29 +397,77 @@ def fetch_transcript(video_id: str) -> list[dict]:
                     and 'duration'.
 
     Raises:
-        Exception: If any error occurs during the fetching process,
-                   e.g., video not found, no subtitles, API key issues,
-                   or YouTube InnerTube API response structure changes.
+        TranscriptNotFoundError: If the video has no transcript.
+        TranscriptResponseError: If the InnerTube response structure is not
+                   recognized; this is not remembered as a missing transcript.
+        Exception: If any other error occurs during the fetching process,
+                   e.g., video not found, no subtitles or API key issues.
     """
+    if video_id in transcript_not_found_cache:
+        raise TranscriptNotFoundError(video_id)
+
     try:
         # Try to get the default language using YouTube Data API
-        lang_info = _get_default_subtitle_language(video_id)
+        lang_info = await _get_default_subtitle_language(video_id)
         language = lang_info["language"]
         track_kind = lang_info["trackKind"]
+        language_confirmed = True
     except Exception as e:
         # If YouTube Data API fails (e.g., no API key, or general API error),
         # try to fallback to a common language like 'en' (English) and 'standard' track.
         # This might not always work but provides a graceful degradation.
-        print(
-            f"Warning: Failed to determine default language via YouTube Data API ({e}). "
-            "Attempting to fetch with default 'en' (English) language and 'standard' track kind."
+        logger.warning(
+            "Failed to determine default language via YouTube Data API (%s). "
+            "Attempting to fetch with default 'en' (English) language "
+            "and 'standard' track kind.",
+            e,
         )
         language = "en"
         track_kind = "standard"  # Or 'asr' if auto-generated is preferred
+        language_confirmed = False
 
-    return _get_subtitles_from_innertube(
-        video_id=video_id, language=language, track_kind=track_kind
-    )
+    try:
+        return await _get_subtitles_from_innertube(
+            video_id=video_id, language=language, track_kind=track_kind
+        )
+    except TranscriptNotFoundError:
+        # A miss on the fallback guess says nothing about the video's real track
+        if language_confirmed:
+            transcript_not_found_cache[video_id] = True
+        raise
+
+
+# Upper bound on transcript fetches in flight at once for a batch, which keeps
+# bursts within the Data API quota while still multiplexing over HTTP/2.
+BATCH_FETCH_CONCURRENCY = 16
+
+
+async def fetch_transcripts(
+    video_ids: list[str], concurrency: int = BATCH_FETCH_CONCURRENCY
+) -> dict[str, list[dict] | Exception]:
+    """
+    Fetches the transcripts for several YouTube video IDs concurrently.
+
+    Args:
+        video_ids (list[str]): The IDs of the YouTube videos.
+        concurrency (int): Maximum number of fetches in flight at once.
+
+    Returns:
+        dict[str, list[dict] | Exception]: Maps each video ID to its transcript
+                    segments (as returned by `fetch_transcript`), or to the
+                    exception raised while fetching it.
+    """
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def fetch_one(video_id: str) -> list[dict] | Exception:
+        async with semaphore:
+            try:
+                return await fetch_transcript(video_id)
+            except Exception as e:
+                return e
+
+    results = await asyncio.gather(*(fetch_one(video_id) for video_id in video_ids))
+    return dict(zip(video_ids, results))
 
 
 # --- Example Usage (when run as a script) ---
@@ -326,10 +502,20 @@ if __name__ == "__main__":
         # 'NON_EXISTENT_VIDEO_ID' # Uncomment to test error handling
     ]
 
-    for video_id in example_video_ids:
-        print(f"--- Fetching transcript for video ID: {video_id} ---")
+    async def fetch_examples():
+        # Fetch all examples concurrently over the shared HTTP/2 client
         try:
-            transcript_data = fetch_transcript(video_id)
+            return await fetch_transcripts(example_video_ids)
+        finally:
+            await aclose()
+
+    results = asyncio.run(fetch_examples())
+
+    for video_id, transcript_data in results.items():
+        print(f"--- Transcript for video ID: {video_id} ---")
+        if isinstance(transcript_data, Exception):
+            print(f"ERROR: Could not fetch transcript for {video_id}: {transcript_data}")
+        else:
             print(f"Successfully fetched {len(transcript_data)} transcript segments.")
             print("\n--- Transcript Snippet (first 5 lines) ---")
             for i, line in enumerate(transcript_data):
@@ -345,6 +531,4 @@ if __name__ == "__main__":
             # print(json.dumps(transcript_data[:5], indent=2)) # Print only first 5 segments as JSON
             # print("...")
 
-        except Exception as e:
-            print(f"ERROR: Could not fetch transcript for {video_id}: {e}")
         print("-" * 60 + "\n")